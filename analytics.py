@@ -3,53 +3,105 @@ Analytics Module for Chatbot Performance Tracking
 Provides insights into conversations, intents, and user satisfaction
 """
 
-from database import Database, get_db_connection
-from datetime import datetime, timedelta
+from database import get_db_connection, submit_db
+from cache_utils import LRUCache
+from datetime import datetime, timedelta, timezone
+from functools import wraps
+import copy
 import json
 
+# Report results are reused for this many seconds before re-querying
+CACHE_TTL = 60
+
+# Cached results kept at most, least recently used first; keys that include
+# the date (one per day) would otherwise pile up in a long-running process
+CACHE_SIZE = 256
+# Reports are nested dicts and lists, so callers get deep copies to modify
+_cache = LRUCache(CACHE_SIZE, copy=copy.deepcopy)
+_MISSING = object()
+
+def ttl_cache(seconds=CACHE_TTL):
+    """Cache a report function's result per arguments for `seconds`"""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            key = (func.__qualname__, args, tuple(sorted(kwargs.items())))
+            result = _cache.get(key, _MISSING)
+            if result is not _MISSING:
+                return result
+            result = func(*args, **kwargs)
+            _cache.set(key, result, ttl=seconds)
+            return result
+        return wrapper
+    return decorator
+
+def clear_cache():
+    """Drop all cached report results"""
+    _cache.clear()
+
 class Analytics:
     """Analytics and reporting for chatbot performance"""
     
     @staticmethod
+    @ttl_cache()
     def get_overview():
         """Get overall chatbot statistics"""
-        stats = Database.get_conversation_stats()
-        
         with get_db_connection() as conn:
             cursor = conn.cursor()
             
-            # Get feedback stats
+            # Conversation, message, feedback and user stats in one round-trip
             cursor.execute('''
                 SELECT 
-                    COUNT(*) as total_feedback,
-                    SUM(CASE WHEN rating > 0 THEN 1 ELSE 0 END) as positive,
-                    SUM(CASE WHEN rating < 0 THEN 1 ELSE 0 END) as negative
-                FROM feedback
+                    (SELECT COUNT(*) FROM conversations) as total_conversations,
+                    (SELECT COUNT(*) FROM messages) as total_messages,
+                    (SELECT COUNT(DISTINCT user_id) FROM conversations) as active_users,
+                    (SELECT COUNT(*) FROM feedback) as total_feedback,
+                    (SELECT SUM(CASE WHEN rating > 0 THEN 1 ELSE 0 END) FROM feedback) as positive,
+                    (SELECT SUM(CASE WHEN rating < 0 THEN 1 ELSE 0 END) FROM feedback) as negative,
+                    (SELECT json_group_array(json_object('intent', intent, 'count', count))
+                     FROM (
+                        SELECT intent, COUNT(*) as count 
+                        FROM messages 
+                        WHERE intent IS NOT NULL 
+                        GROUP BY intent 
+                        ORDER BY count DESC
+                     )) as intent_distribution
             ''')
-            feedback = dict(cursor.fetchone())
-            
-            # Calculate satisfaction rate
-            if feedback['total_feedback'] > 0:
-                satisfaction_rate = (feedback['positive'] / feedback['total_feedback']) * 100
-            else:
-                satisfaction_rate = 0
-            
-            # Get active users
-            cursor.execute('SELECT COUNT(DISTINCT user_id) as active_users FROM conversations')
-            active_users = cursor.fetchone()['active_users']
+            row = cursor.fetchone()
+        
+        total_conversations = row['total_conversations']
+        total_messages = row['total_messages']
+        avg_messages = total_messages / total_conversations if total_conversations > 0 else 0
+        
+        feedback = {
+            'total_feedback': row['total_feedback'],
+            'positive': row['positive'],
+            'negative': row['negative']
+        }
+        
+        # Calculate satisfaction rate
+        if feedback['total_feedback'] > 0:
+            satisfaction_rate = (feedback['positive'] / feedback['total_feedback']) * 100
+        else:
+            satisfaction_rate = 0
         
         return {
-            **stats,
+            'total_conversations': total_conversations,
+            'total_messages': total_messages,
+            'avg_messages_per_conversation': round(avg_messages, 2),
+            'intent_distribution': json.loads(row['intent_distribution']),
             'feedback': feedback,
             'satisfaction_rate': round(satisfaction_rate, 2),
-            'active_users': active_users
+            'active_users': row['active_users']
         }
     
     @staticmethod
+    @ttl_cache()
     def get_intent_performance():
         """Get performance metrics per intent"""
         with get_db_connection() as conn:
             cursor = conn.cursor()
+            cursor.row_factory = None  # Unpack plain tuples into the result dicts
             
             cursor.execute('''
                 SELECT 
@@ -66,89 +118,117 @@ class Analytics:
             ''')
             
             results = []
-            for row in cursor.fetchall():
-                row_dict = dict(row)
-                if row_dict['feedback_count'] > 0:
-                    row_dict['satisfaction'] = round((row_dict['positive_feedback'] / row_dict['feedback_count']) * 100, 2)
-                else:
-                    row_dict['satisfaction'] = None
-                row_dict['avg_confidence'] = round(row_dict['avg_confidence'], 3) if row_dict['avg_confidence'] else 0
-                results.append(row_dict)
+            for intent, total_messages, avg_confidence, feedback_count, positive_feedback in cursor:
+                results.append({
+                    'intent': intent,
+                    'total_messages': total_messages,
+                    'avg_confidence': round(avg_confidence, 3) if avg_confidence else 0,
+                    'feedback_count': feedback_count,
+                    'positive_feedback': positive_feedback,
+                    'satisfaction': round((positive_feedback / feedback_count) * 100, 2) if feedback_count > 0 else None
+                })
             
             return results
     
     @staticmethod
+    @ttl_cache()
     def get_recent_conversations(limit=10):
         """Get recent conversation summaries"""
         with get_db_connection() as conn:
             cursor = conn.cursor()
             
+            # Pick the latest conversations first, then count messages for just those
             cursor.execute('''
+                WITH recent AS (
+                    SELECT id, session_id, started_at, ended_at, user_id
+                    FROM conversations
+                    ORDER BY started_at DESC
+                    LIMIT ?
+                )
                 SELECT 
-                    c.id,
-                    c.session_id,
-                    c.started_at,
-                    c.ended_at,
+                    r.id,
+                    r.session_id,
+                    r.started_at,
+                    r.ended_at,
                     u.username,
-                    COUNT(m.id) as message_count
-                FROM conversations c
-                LEFT JOIN users u ON u.id = c.user_id
-                LEFT JOIN messages m ON m.conversation_id = c.id
-                GROUP BY c.id
-                ORDER BY c.started_at DESC
-                LIMIT ?
+                    (SELECT COUNT(*) FROM messages m WHERE m.conversation_id = r.id) as message_count
+                FROM recent r
+                LEFT JOIN users u ON u.id = r.user_id
+                ORDER BY r.started_at DESC
             ''', (limit,))
             
-            return [dict(row) for row in cursor.fetchall()]
+            return cursor.fetchall()
     
     @staticmethod
+    @ttl_cache()
     def get_common_queries(limit=20):
         """Get most common user queries"""
         with get_db_connection() as conn:
             cursor = conn.cursor()
+            cursor.row_factory = None  # Unpack plain tuples into the result dicts
             
             cursor.execute('''
                 SELECT 
                     message,
                     intent,
-                    COUNT(*) as frequency,
-                    AVG(confidence) as avg_confidence
-                FROM messages
-                WHERE sender = 'user' AND intent IS NOT NULL
-                GROUP BY message, intent
+                    frequency,
+                    confidence_total / confidence_count as avg_confidence
+                FROM query_frequency
                 ORDER BY frequency DESC
                 LIMIT ?
             ''', (limit,))
             
-            results = []
-            for row in cursor.fetchall():
-                row_dict = dict(row)
-                row_dict['avg_confidence'] = round(row_dict['avg_confidence'], 3)
-                results.append(row_dict)
-            
-            return results
+            return [
+                {
+                    'message': message,
+                    'intent': intent,
+                    'frequency': frequency,
+                    'avg_confidence': round(avg_confidence, 3)
+                }
+                for message, intent, frequency, avg_confidence in cursor
+            ]
     
     @staticmethod
-    def get_time_based_stats(days=7):
-        """Get statistics for the last N days"""
+    @ttl_cache(seconds=24 * 60 * 60)
+    def _get_completed_day_stats(days, today):
+        """Per-day conversation counts before `today`; these never change"""
+        cutoff_date = (datetime.fromisoformat(today) - timedelta(days=days)).date().isoformat()
+        
         with get_db_connection() as conn:
             cursor = conn.cursor()
             
-            cutoff_date = datetime.now() - timedelta(days=days)
-            
             cursor.execute('''
-                SELECT 
-                    DATE(started_at) as date,
-                    COUNT(*) as conversations
-                FROM conversations
-                WHERE started_at >= ?
-                GROUP BY DATE(started_at)
+                SELECT date, conversations
+                FROM conversation_daily
+                WHERE date >= ? AND date < ?
                 ORDER BY date
-            ''', (cutoff_date,))
+            ''', (cutoff_date, today))
             
-            return [dict(row) for row in cursor.fetchall()]
+            return cursor.fetchall()
+    
+    @staticmethod
+    def get_time_based_stats(days=7):
+        """Get statistics for the last N days"""
+        # Timestamps are stored in UTC (CURRENT_TIMESTAMP)
+        today = datetime.now(timezone.utc).date().isoformat()
+        stats = list(Analytics._get_completed_day_stats(days, today))
+        
+        # The current day is still changing, so count it live
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                'SELECT COUNT(*) as conversations FROM conversations WHERE started_at >= ?',
+                (today,)
+            )
+            today_count = cursor.fetchone()['conversations']
+        
+        if today_count:
+            stats.append({'date': today, 'conversations': today_count})
+        
+        return stats
     
     @staticmethod
+    @ttl_cache()
     def generate_report():
         """Generate comprehensive analytics report"""
         report = {
@@ -161,6 +241,16 @@ class Analytics:
         
         return report
     
+    @staticmethod
+    def aget_overview():
+        """Run get_overview on the database executor; returns a Future"""
+        return submit_db(Analytics.get_overview)
+    
+    @staticmethod
+    def agenerate_report():
+        """Run generate_report on the database executor; returns a Future"""
+        return submit_db(Analytics.generate_report)
+    
     @staticmethod
     def print_report():
         """Print formatted analytics report"""
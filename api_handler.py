@@ -4,8 +4,43 @@ Provides mock APIs for products, orders, inventory, and user data
 """
 
 from database import Database
+import copy
+import itertools
 import random
 
+# Mock ID sequences: next() on a counter is a single C call with no RNG
+# lock; random start points keep restarts from replaying the same IDs
+_TRACKING_SEQ = itertools.count(random.randrange(900000))
+_RETURN_SEQ = itertools.count(random.randrange(9000))
+
+# Static responses, built once instead of on every call; callers get
+# copies, so changing a response does not change later ones
+_ORDER_STATUS_INFO = {
+    'Processing': 'Your order is being prepared. Expected ship date: 1-2 business days.',
+    'Shipped': 'Your order has been shipped. Expected delivery: 3-5 business days.',
+    'Delivered': 'Your order has been delivered.',
+    'Cancelled': 'Your order has been cancelled.'
+}
+
+_SHIPPING_INFO = {
+    'success': True,
+    'options': [
+        {'name': 'Standard', 'duration': '5-7 business days', 'cost': 'Free'},
+        {'name': 'Express', 'duration': '2-3 business days', 'cost': '$9.99'},
+        {'name': 'Next Day', 'duration': '1 business day', 'cost': '$19.99'}
+    ]
+}
+
+_RETURN_POLICY = {
+    'success': True,
+    'policy': {
+        'return_window': '30 days',
+        'condition': 'Unused and in original packaging',
+        'refund_time': '5-7 business days',
+        'shipping': 'Free return shipping label provided'
+    }
+}
+
 class APIHandler:
     """Handles API calls for dynamic data"""
     
@@ -31,12 +66,12 @@ class APIHandler:
                 }
             return {'success': False, 'error': 'No products found'}
         
-        # Return all products
-        products = Database.get_all_products()
+        # Return the first products along with the catalog size
+        products, total = Database.get_products_paginated(limit=10)
         return {
             'success': True,
-            'products': products[:10],  # Limit to 10
-            'count': len(products)
+            'products': products,
+            'count': total
         }
     
     @staticmethod
@@ -75,20 +110,12 @@ class APIHandler:
         """Get order status"""
         order = Database.get_order(order_number)
         if order:
-            # Calculate estimated delivery (mock)
-            status_info = {
-                'Processing': 'Your order is being prepared. Expected ship date: 1-2 business days.',
-                'Shipped': 'Your order has been shipped. Expected delivery: 3-5 business days.',
-                'Delivered': 'Your order has been delivered.',
-                'Cancelled': 'Your order has been cancelled.'
-            }
-            
             return {
                 'success': True,
                 'order_number': order['order_number'],
                 'status': order['status'],
                 'total': order['total'],
-                'info': status_info.get(order['status'], 'Status unknown')
+                'info': _ORDER_STATUS_INFO.get(order['status'], 'Status unknown')
             }
         return {'success': False, 'error': 'Order not found'}
     
@@ -109,7 +136,7 @@ class APIHandler:
             order = Database.get_order(order_number)
             if order:
                 # Mock tracking info
-                tracking_number = f"TRK{random.randint(100000, 999999)}"
+                tracking_number = f"TRK{100000 + next(_TRACKING_SEQ) % 900000}"
                 return {
                     'success': True,
                     'order_number': order_number,
@@ -120,34 +147,19 @@ class APIHandler:
             return {'success': False, 'error': 'Order not found'}
         
         # General shipping info
-        return {
-            'success': True,
-            'options': [
-                {'name': 'Standard', 'duration': '5-7 business days', 'cost': 'Free'},
-                {'name': 'Express', 'duration': '2-3 business days', 'cost': '$9.99'},
-                {'name': 'Next Day', 'duration': '1 business day', 'cost': '$19.99'}
-            ]
-        }
+        return copy.deepcopy(_SHIPPING_INFO)
     
     @staticmethod
     def get_return_policy():
         """Get return policy information"""
-        return {
-            'success': True,
-            'policy': {
-                'return_window': '30 days',
-                'condition': 'Unused and in original packaging',
-                'refund_time': '5-7 business days',
-                'shipping': 'Free return shipping label provided'
-            }
-        }
+        return copy.deepcopy(_RETURN_POLICY)
     
     @staticmethod
     def initiate_return(order_number, reason=None):
         """Initiate a return (mock)"""
         order = Database.get_order(order_number)
         if order:
-            return_id = f"RET-{random.randint(1000, 9999)}"
+            return_id = f"RET-{1000 + next(_RETURN_SEQ) % 9000}"
             return {
                 'success': True,
                 'return_id': return_id,
@@ -210,9 +222,9 @@ def get_dynamic_response(intent, entities, user_context=None):
     
     # Pricing
     if intent == 'pricing' and user_context:
-        products = Database.get_all_products()
-        if products:
-            return f"Our products range from ${min(p['price'] for p in products):.2f} to ${max(p['price'] for p in products):.2f}. What specific product are you interested in?"
+        min_price, max_price = Database.get_price_range()
+        if min_price is not None:
+            return f"Our products range from ${min_price:.2f} to ${max_price:.2f}. What specific product are you interested in?"
     
     return None  # No dynamic response available
 
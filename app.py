@@ -1,4 +1,7 @@
-from flask import Flask, render_template, request, jsonify
+import threading
+
+import orjson
+from flask import Flask, render_template, request
 from flask_cors import CORS
 
 from chatbot_enhanced import EnhancedChatbot
@@ -6,8 +9,24 @@ from chatbot_enhanced import EnhancedChatbot
 app = Flask(__name__)
 CORS(app)
 
-# Initialize chatbot
-chatbot = EnhancedChatbot()
+# Chatbot is created on first use so importing the app stays cheap
+_chatbot = None
+_chatbot_lock = threading.Lock()
+
+
+def get_chatbot():
+    """Return the shared chatbot, loading the model on the first call"""
+    global _chatbot
+    if _chatbot is None:
+        with _chatbot_lock:
+            if _chatbot is None:
+                _chatbot = EnhancedChatbot()
+    return _chatbot
+
+
+def json_response(payload, status=200):
+    """JSON response serialized with orjson (faster than jsonify's json)"""
+    return app.response_class(orjson.dumps(payload), status=status, mimetype="application/json")
 
 
 @app.route("/")
@@ -22,20 +41,20 @@ def chat():
         user_message = data.get("message", "").strip()
 
         if not user_message:
-            return jsonify({"response": "Please type a message."})
+            return json_response({"response": "Please type a message."})
 
         # ✅ CORRECT METHOD
-        bot_reply = chatbot.chat(user_message)
+        bot_reply = get_chatbot().chat(user_message)
 
-        return jsonify({
+        return json_response({
             "response": bot_reply
         })
 
     except Exception as e:
         print("CHAT ERROR:", e)  # <-- IMPORTANT for debugging
-        return jsonify({
+        return json_response({
             "response": "Sorry, something went wrong on the server."
-        }), 500
+        }, 500)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,65 @@
+"""
+Cache Utilities
+In-process LRU cache shared by the database, analytics, chatbot and context modules
+"""
+
+from collections import OrderedDict
+import threading
+import time
+
+class LRUCache:
+    """
+    Least recently used cache with optional expiry, safe to share between threads
+
+    Args:
+        max_size (int): Entries kept at most; the least recently used go first
+        ttl (float): Default seconds an entry stays valid, or None to keep it
+        copy (callable): Applied to values going in and out, so callers can
+            modify what they are given without changing the cached value
+    """
+
+    def __init__(self, max_size, ttl=None, copy=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._copy = copy
+        self._entries = OrderedDict()  # key -> (expires at or None, value)
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """Get a cached value, or default if it is missing or has expired"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            expires_at, value = entry
+            if expires_at is not None and time.monotonic() >= expires_at:
+                del self._entries[key]
+                return default
+            self._entries.move_to_end(key)
+        return self._copy(value) if self._copy else value
+
+    def set(self, key, value, ttl=None):
+        """Cache a value for `ttl` seconds (default: the cache's TTL)"""
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = None if ttl is None else time.monotonic() + ttl
+        if self._copy:
+            value = self._copy(value)
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        """Drop a cached value, if present"""
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        """Drop all cached values"""
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
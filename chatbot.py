@@ -7,21 +7,75 @@ import json
 import pickle
 import os
 import random
+import joblib
+from cache_utils import LRUCache
 from nlp_utils import clean_text, download_nltk_data
 
+# Number of distinct cleaned inputs whose predictions are kept in memory
+PREDICTION_CACHE_SIZE = 4096
+
+_FALLBACK_RESPONSES = (
+    "I'm not quite sure I understand. Could you please rephrase your question?",
+    "I didn't quite catch that. Can you try asking in a different way?",
+    "I'm still learning! Could you provide more details or ask differently?",
+    "I'm not certain about that. Would you like to speak with a human representative?",
+    "I want to make sure I help you correctly. Could you clarify your question?"
+)
+
+def load_artifact(model_dir, name):
+    """Load a separately saved model artifact, memory-mapping its NumPy arrays"""
+    path = os.path.join(model_dir, f'{name}.joblib')
+    if os.path.exists(path):
+        return joblib.load(path, mmap_mode='r')
+    
+    # Models saved before the switch to joblib
+    with open(os.path.join(model_dir, f'{name}.pkl'), 'rb') as f:
+        return pickle.load(f)
+
+def load_model_bundle(model_dir):
+    """
+    Load the trained model, memory-mapping its NumPy arrays
+    
+    Returns:
+        dict: 'vectorizer', 'classifier' and 'tags'
+    """
+    path = os.path.join(model_dir, 'model.joblib')
+    if os.path.exists(path):
+        return joblib.load(path, mmap_mode='r')
+    
+    # Models saved as one file per artifact. The .pkl ones predate the
+    # current vectorizer and text preprocessing, so they are only a fallback
+    if not os.path.exists(os.path.join(model_dir, 'vectorizer.joblib')):
+        print(f"Warning: loading a legacy .pkl model from '{model_dir}/'; "
+              "it does not match the current preprocessing. Run train_model.py to retrain.")
+    return {name: load_artifact(model_dir, name) for name in ('vectorizer', 'classifier', 'tags')}
+
 class CustomerServiceChatbot:
     """Main chatbot class"""
     
-    def __init__(self, model_dir='model', intents_file='intents.json'):
-        """Initialize the chatbot"""
+    def __init__(self, model_dir='model', intents_file='intents.json', rng=None):
+        """
+        Initialize the chatbot
+        
+        Args:
+            rng: random.Random used to pick responses; defaults to the
+                random module, so random.seed() makes replies reproducible
+        """
         self.model_dir = model_dir
         self.intents_file = intents_file
         self.vectorizer = None
         self.classifier = None
         self.tags = None
         self.intents_data = None
+        self._responses_by_tag = {}
         self.confidence_threshold = 0.5
         
+        self._rng = rng if rng is not None else random
+        
+        # Predictions by cleaned input, least recently used first; repeated
+        # queries skip vectorization and inference
+        self._predictions = LRUCache(PREDICTION_CACHE_SIZE)
+        
         # Load model and intents
         self.load_model()
         self.load_intents()
@@ -29,17 +83,13 @@ class CustomerServiceChatbot:
     def load_model(self):
         """Load trained model and vectorizer"""
         try:
-            # Load vectorizer
-            with open(os.path.join(self.model_dir, 'vectorizer.pkl'), 'rb') as f:
-                self.vectorizer = pickle.load(f)
-            
-            # Load classifier
-            with open(os.path.join(self.model_dir, 'classifier.pkl'), 'rb') as f:
-                self.classifier = pickle.load(f)
+            model = load_model_bundle(self.model_dir)
+            self.vectorizer = model['vectorizer']
+            self.classifier = model['classifier']
+            self.tags = model['tags']
             
-            # Load tags
-            with open(os.path.join(self.model_dir, 'tags.pkl'), 'rb') as f:
-                self.tags = pickle.load(f)
+            # Cached predictions belong to the previous model
+            self.clear_cache()
             
             print("[OK] Model loaded successfully!")
         except FileNotFoundError:
@@ -51,6 +101,9 @@ class CustomerServiceChatbot:
         try:
             with open(self.intents_file, 'r', encoding='utf-8') as f:
                 self.intents_data = json.load(f)
+            self._responses_by_tag = {
+                intent['tag']: intent['responses'] for intent in self.intents_data['intents']
+            }
             print("[OK] Intents loaded successfully!")
         except FileNotFoundError:
             print(f"Error: {self.intents_file} not found.")
@@ -64,39 +117,63 @@ class CustomerServiceChatbot:
             intent (str): Predicted intent tag
             confidence (float): Confidence score
         """
-        # Clean the input
-        cleaned_input = clean_text(user_input)
+        return self._predict_cleaned([clean_text(user_input)])[0]
+    
+    def _predict_cleaned(self, cleaned_inputs):
+        """Predict intents for already cleaned inputs, using cached predictions where possible"""
+        results = {}
+        misses = []
+        for cleaned_input in cleaned_inputs:
+            if cleaned_input in results:
+                continue
+            prediction = self._predictions.get(cleaned_input)
+            results[cleaned_input] = prediction
+            if prediction is None:
+                misses.append(cleaned_input)
         
-        # Vectorize
-        input_vector = self.vectorizer.transform([cleaned_input])
+        if misses:
+            # Only the inputs not seen before are vectorized, in one pass
+            input_vectors = self.vectorizer.transform(misses)
+            # The most probable class is the prediction, so one call gives both
+            probabilities = self.classifier.predict_proba(input_vectors)
+            best = probabilities.argmax(axis=1)
+            predictions = [
+                (self.classifier.classes_[index], float(row[index]))
+                for index, row in zip(best, probabilities)
+            ]
+            
+            for cleaned_input, prediction in zip(misses, predictions):
+                results[cleaned_input] = prediction
+                self._predictions.set(cleaned_input, prediction)
         
-        # Predict
-        intent = self.classifier.predict(input_vector)[0]
+        return [results[cleaned_input] for cleaned_input in cleaned_inputs]
+    
+    def clear_cache(self):
+        """Forget cached predictions (call after changing the model)"""
+        self._predictions.clear()
+    
+    def predict_intent_batch(self, user_inputs):
+        """
+        Predict intents for several inputs with a single vectorizer/classifier pass
         
-        # Get probability/confidence
-        probabilities = self.classifier.predict_proba(input_vector)[0]
-        confidence = max(probabilities)
+        Cached and repeated inputs are not vectorized again.
         
-        return intent, confidence
+        Returns:
+            list: (intent, confidence) tuples in input order
+        """
+        return self._predict_cleaned([clean_text(user_input) for user_input in user_inputs])
     
     def get_response(self, intent):
         """Get a random response for the predicted intent"""
-        for intent_data in self.intents_data['intents']:
-            if intent_data['tag'] == intent:
-                return random.choice(intent_data['responses'])
+        responses = self._responses_by_tag.get(intent)
+        if responses:
+            return self._rng.choice(responses)
         
         return "I'm not sure I understand. Could you rephrase that?"
     
     def get_fallback_response(self):
         """Return a fallback response when confidence is low"""
-        fallback_responses = [
-            "I'm not quite sure I understand. Could you please rephrase your question?",
-            "I didn't quite catch that. Can you try asking in a different way?",
-            "I'm still learning! Could you provide more details or ask differently?",
-            "I'm not certain about that. Would you like to speak with a human representative?",
-            "I want to make sure I help you correctly. Could you clarify your question?"
-        ]
-        return random.choice(fallback_responses)
+        return self._rng.choice(_FALLBACK_RESPONSES)
     
     def chat(self, user_input):
         """
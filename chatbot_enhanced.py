@@ -2,12 +2,81 @@
 Customer Service Chatbot – Final Version with Confirmation & Undo
 """
 
-import os
-import pickle
 import random
 import re
+from enum import IntEnum
+from chatbot import load_model_bundle
 from nlp_utils import download_nltk_data
 
+# Loaded (vectorizer, classifier) per model directory, shared by all instances
+_MODELS = {}
+
+_ORDER_RE = re.compile(r"(ORD|ORDER)[-_]?\d+")
+
+# Keyword -> intent routing. The lookahead makes findall report every
+# (possibly overlapping) keyword occurrence in a single scan of the text.
+_KEYWORD_TO_INTENT = {
+    "cancel": "cancel",
+    "order": "order",
+    "delivery": "order",
+    "where is": "order",
+    "refund": "refund",
+    "money back": "refund",
+    "hi": "greeting",
+    "hello": "greeting",
+    "human": "human",
+    "agent": "human",
+}
+_KEYWORD_RE = re.compile(
+    "(?=(" + "|".join(re.escape(k) for k in _KEYWORD_TO_INTENT) + "))"
+)
+# First matching intent wins
+_INTENT_PRIORITY = ("cancel", "order", "refund", "greeting", "human")
+
+# Possible demo order details
+_FAKE_ORDERS = (
+    {"status": "Out for delivery", "expected": "Tomorrow", "location": "City warehouse"},
+    {"status": "In transit", "expected": "Tomorrow", "location": "City warehouse"},
+    {"status": "Delivered", "expected": "Delivered", "location": "Customer address"},
+)
+
+# Fixed replies
+_ASK_YES_NO_REPLY = "Please reply with **Yes** or **No**."
+_CANCEL_ABORTED_REPLY = "👍 Cancellation aborted. Your order is still active."
+_INVALID_ORDER_ID_REPLY = "Please share a valid **order ID** (example: ORD12345)."
+_REFUND_SUBMITTED_REPLY = (
+    "✅ Refund request submitted.\n"
+    "Your refund will be processed within 5–7 business days.\n\n"
+    "Anything else I can help you with?"
+)
+_CANCEL_ASK_ID_REPLY = "Sure 👍 Please share your **order ID** to cancel the order."
+_ORDER_ASK_ID_REPLY = (
+    "I can help with your order 😊\n"
+    "Please share your **order ID** so I can check its status."
+)
+_REFUND_ASK_REASON_REPLY = "I can help with a refund 👍 What is the reason?"
+_GREETING_REPLY = (
+    "Hello! 👋 How can I help you today?\n"
+    "• Track an order\n"
+    "• Delivery issues\n"
+    "• Refunds\n"
+    "• Cancel an order"
+)
+_GREETING_AGAIN_REPLY = "Hi again 😊 What would you like help with?"
+_HUMAN_AGENT_REPLY = "👤 Connecting you to a human support agent. Please wait..."
+_FALLBACK_REPLY = (
+    "I’m here to help 🙂\n"
+    "You can ask about your **order**, **delivery**, **refund**, or **cancellation**."
+)
+
+
+class State(IntEnum):
+    """What the bot is waiting for from the user"""
+    IDLE = 0
+    AWAIT_ORDER_ID = 1
+    AWAIT_REFUND_REASON = 2
+    AWAIT_CANCEL_CONFIRM = 3
+
 
 class EnhancedChatbot:
     def __init__(self, model_dir="model"):
@@ -18,162 +87,168 @@ class EnhancedChatbot:
         self.classifier = None
 
         # Conversation state
+        self.state = State.IDLE
         self.help_shown = False
-        self.waiting_for_order_id = False
-        self.waiting_for_refund_reason = False
 
         self.last_order_id = None
         self.last_order_status = None
 
-        self.awaiting_cancel_confirmation = False
         self.cancelled_order_backup = None  # for undo
 
+        self._state_handlers = {
+            State.IDLE: self._handle_idle,
+            State.AWAIT_ORDER_ID: self._handle_order_id,
+            State.AWAIT_REFUND_REASON: self._handle_refund_reason,
+            State.AWAIT_CANCEL_CONFIRM: self._handle_cancel_confirm,
+        }
+
+        self._intent_handlers = {
+            "cancel": self._handle_cancel,
+            "order": self._handle_order,
+            "refund": self._handle_refund,
+            "greeting": self._handle_greeting,
+            "human": self._handle_human,
+        }
+
         self.load_model()
 
     # ---------------- LOAD MODEL ---------------- #
 
     def load_model(self):
-        with open(os.path.join(self.model_dir, "vectorizer.pkl"), "rb") as f:
-            self.vectorizer = pickle.load(f)
-        with open(os.path.join(self.model_dir, "classifier.pkl"), "rb") as f:
-            self.classifier = pickle.load(f)
+        if self.model_dir not in _MODELS:
+            model = load_model_bundle(self.model_dir)
+            _MODELS[self.model_dir] = (model["vectorizer"], model["classifier"])
+        self.vectorizer, self.classifier = _MODELS[self.model_dir]
 
     # ---------------- HELPERS ---------------- #
 
-    def extract_order_id(self, text):
-        match = re.search(r"(ORD|ORDER)[-_]?\d+", text.upper())
+    def extract_order_id(self, text_upper):
+        """Find an order ID in already uppercased text"""
+        match = _ORDER_RE.search(text_upper)
         return match.group(0) if match else None
 
     def fake_order(self, order_id):
-        status = random.choice(["Out for delivery", "In transit", "Delivered"])
-        return {
-            "status": status,
-            "expected": "Tomorrow" if status != "Delivered" else "Delivered",
-            "location": "City warehouse" if status != "Delivered" else "Customer address"
-        }
+        # A copy, so callers cannot change the shared template
+        return dict(_FAKE_ORDERS[random.randrange(len(_FAKE_ORDERS))])
 
     # ---------------- CHAT ---------------- #
 
     def chat(self, user_input):
         text = user_input.lower().strip()
 
-        # ----- CONFIRM CANCELLATION -----
-        if self.awaiting_cancel_confirmation:
-            if text in ["yes", "y"]:
-                self.awaiting_cancel_confirmation = False
+        # ----- UNDO CANCELLATION -----
+        # Works from any state except while confirming a cancellation
+        if (
+            self.cancelled_order_backup
+            and self.state != State.AWAIT_CANCEL_CONFIRM
+            and "undo" in text
+        ):
+            return self._undo_cancellation()
+
+        return self._state_handlers[self.state](user_input, text)
+
+    def _undo_cancellation(self):
+        restored = self.cancelled_order_backup
+        self.last_order_id = restored
+        self.last_order_status = "In transit"
+        self.cancelled_order_backup = None
 
-                # Delivered orders cannot be cancelled
-                if self.last_order_status == "Delivered":
-                    return (
-                        f"❌ Order **{self.last_order_id}** has already been delivered and cannot be cancelled."
-                    )
+        return (
+            f"✅ Cancellation undone.\n"
+            f"Order **{restored}** is active again and currently in transit."
+        )
+
+    # ---------------- STATE HANDLERS ---------------- #
 
-                # Backup for undo
-                self.cancelled_order_backup = self.last_order_id
-                cancelled = self.last_order_id
-                self.last_order_id = None
-                self.last_order_status = None
+    def _handle_cancel_confirm(self, user_input, text):
+        if text in ["yes", "y"]:
+            self.state = State.IDLE
 
+            # Delivered orders cannot be cancelled
+            if self.last_order_status == "Delivered":
                 return (
-                    f"❌ Order **{cancelled}** has been cancelled successfully.\n\n"
-                    "If this was a mistake, type **undo**."
+                    f"❌ Order **{self.last_order_id}** has already been delivered and cannot be cancelled."
                 )
 
-            if text in ["no", "n"]:
-                self.awaiting_cancel_confirmation = False
-                return "👍 Cancellation aborted. Your order is still active."
-
-            return "Please reply with **Yes** or **No**."
-
-        # ----- UNDO CANCELLATION -----
-        if "undo" in text and self.cancelled_order_backup:
-            restored = self.cancelled_order_backup
-            self.last_order_id = restored
-            self.last_order_status = "In transit"
-            self.cancelled_order_backup = None
+            # Backup for undo
+            self.cancelled_order_backup = self.last_order_id
+            cancelled = self.last_order_id
+            self.last_order_id = None
+            self.last_order_status = None
 
             return (
-                f"✅ Cancellation undone.\n"
-                f"Order **{restored}** is active again and currently in transit."
+                f"❌ Order **{cancelled}** has been cancelled successfully.\n\n"
+                "If this was a mistake, type **undo**."
             )
 
-        # ----- WAITING FOR ORDER ID -----
-        if self.waiting_for_order_id:
-            order_id = self.extract_order_id(text)
-            if not order_id:
-                return "Please share a valid **order ID** (example: ORD12345)."
+        if text in ["no", "n"]:
+            self.state = State.IDLE
+            return _CANCEL_ABORTED_REPLY
 
-            self.waiting_for_order_id = False
-            details = self.fake_order(order_id)
+        return _ASK_YES_NO_REPLY
 
-            self.last_order_id = order_id
-            self.last_order_status = details["status"]
+    def _handle_order_id(self, user_input, text):
+        # Uppercased only on this path; the other handlers work on `text`
+        order_id = self.extract_order_id(user_input.upper())
+        if not order_id:
+            return _INVALID_ORDER_ID_REPLY
 
-            return (
-                f"📦 Order **{order_id}** details:\n"
-                f"• Status: {details['status']}\n"
-                f"• Expected delivery: {details['expected']}\n"
-                f"• Current location: {details['location']}\n\n"
-                "Can I help you with anything else?"
-            )
+        self.state = State.IDLE
+        details = self.fake_order(order_id)
 
-        # ----- REFUND FLOW -----
-        if self.waiting_for_refund_reason:
-            self.waiting_for_refund_reason = False
-            return (
-                "✅ Refund request submitted.\n"
-                "Your refund will be processed within 5–7 business days.\n\n"
-                "Anything else I can help you with?"
-            )
+        self.last_order_id = order_id
+        self.last_order_status = details["status"]
 
-        # ----- CANCEL ORDER -----
-        if "cancel" in text:
-            if not self.last_order_id:
-                self.waiting_for_order_id = True
-                return "Sure 👍 Please share your **order ID** to cancel the order."
+        return (
+            f"📦 Order **{order_id}** details:\n"
+            f"• Status: {details['status']}\n"
+            f"• Expected delivery: {details['expected']}\n"
+            f"• Current location: {details['location']}\n\n"
+            "Can I help you with anything else?"
+        )
 
-            self.awaiting_cancel_confirmation = True
-            return (
-                f"⚠️ Are you sure you want to cancel order **{self.last_order_id}**?\n"
-                "Reply **Yes** or **No**."
-            )
+    def _handle_refund_reason(self, user_input, text):
+        self.state = State.IDLE
+        return _REFUND_SUBMITTED_REPLY
 
-        # ----- ORDER / DELIVERY SHORTCUT -----
-        if "order" in text or "delivery" in text or "where is" in text:
-            self.waiting_for_order_id = True
-            return (
-                "I can help with your order 😊\n"
-                "Please share your **order ID** so I can check its status."
-            )
+    def _handle_idle(self, user_input, text):
+        matched = {_KEYWORD_TO_INTENT[k] for k in _KEYWORD_RE.findall(text)}
+        for intent in _INTENT_PRIORITY:
+            if intent in matched:
+                return self._intent_handlers[intent]()
 
-        # ----- REFUND -----
-        if "refund" in text or "money back" in text:
-            self.waiting_for_refund_reason = True
-            return "I can help with a refund 👍 What is the reason?"
+        return _FALLBACK_REPLY
 
-        # ----- GREETING -----
-        if "hi" in text or "hello" in text:
-            if not self.help_shown:
-                self.help_shown = True
-                return (
-                    "Hello! 👋 How can I help you today?\n"
-                    "• Track an order\n"
-                    "• Delivery issues\n"
-                    "• Refunds\n"
-                    "• Cancel an order"
-                )
-            return "Hi again 😊 What would you like help with?"
+    # ---------------- INTENT HANDLERS ---------------- #
 
-        # ----- HUMAN AGENT -----
-        if "human" in text or "agent" in text:
-            return "👤 Connecting you to a human support agent. Please wait..."
+    def _handle_cancel(self):
+        if not self.last_order_id:
+            self.state = State.AWAIT_ORDER_ID
+            return _CANCEL_ASK_ID_REPLY
 
-        # ----- FALLBACK -----
+        self.state = State.AWAIT_CANCEL_CONFIRM
         return (
-            "I’m here to help 🙂\n"
-            "You can ask about your **order**, **delivery**, **refund**, or **cancellation**."
+            f"⚠️ Are you sure you want to cancel order **{self.last_order_id}**?\n"
+            "Reply **Yes** or **No**."
         )
 
+    def _handle_order(self):
+        self.state = State.AWAIT_ORDER_ID
+        return _ORDER_ASK_ID_REPLY
+
+    def _handle_refund(self):
+        self.state = State.AWAIT_REFUND_REASON
+        return _REFUND_ASK_REASON_REPLY
+
+    def _handle_greeting(self):
+        if not self.help_shown:
+            self.help_shown = True
+            return _GREETING_REPLY
+        return _GREETING_AGAIN_REPLY
+
+    def _handle_human(self):
+        return _HUMAN_AGENT_REPLY
+
 
 # ---------------- TEST MODE ---------------- #
 if __name__ == "__main__":
@@ -3,24 +3,84 @@ Context Manager for Conversation Tracking
 Handles conversation state, history, and context-aware responses
 """
 
-from datetime import datetime
-from database import Database
+from collections import OrderedDict, deque
+from datetime import datetime, timezone
+from database import Database, submit_db_write
+from cache_utils import LRUCache
+import orjson
+from itertools import islice
+import atexit
+import logging
 import re
+import threading
+import time
+import weakref
+
+logger = logging.getLogger(__name__)
+
+# Buffered messages are written at the end of each turn (the bot reply),
+# or once this many are pending
+FLUSH_THRESHOLD = 2
+
+# Most recent messages kept in memory per conversation; all of them are in
+# the database
+MAX_HISTORY = 100
+
+# Contexts kept in memory per process; older ones are evicted to the store
+MAX_CONTEXTS = 1024
+# Seconds a stored context survives without activity
+CONTEXT_TTL = 1800
+# States of evicted contexts kept in process when there is no shared store
+MAX_STORED_CONTEXTS = 8192
+
+# Entity patterns by entity key, compiled once. Each is searched on its
+# own: one combined alternation would hide a match that overlaps another
+# (a phone number that is an email's local part)
+_ENTITY_PATTERNS = (
+    ('order_number', re.compile(r'(?i:ORD)-\d{4}-\d{3}')),  # Format: ORD-YYYY-NNN
+    ('email', re.compile(r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b')),
+    ('phone', re.compile(r'\b\d{3}[-.]?\d{3}[-.]?\d{4}\b')),  # Simple pattern
+)
+
+def _to_epoch(timestamp):
+    """Convert a SQLite CURRENT_TIMESTAMP value (UTC text) to epoch seconds"""
+    return datetime.fromisoformat(timestamp).replace(tzinfo=timezone.utc).timestamp()
+
+# Contexts alive in this process, so messages still buffered are written at exit
+_LIVE_CONTEXTS = weakref.WeakSet()
+
+def _close_contexts():
+    """Write the buffered messages of every live context"""
+    for context in list(_LIVE_CONTEXTS):
+        try:
+            context.close()
+        except Exception as e:
+            logger.error("Writing buffered messages for session %s failed: %s", context.session_id, e)
+
+atexit.register(_close_contexts)
 
 class ConversationContext:
     """Manages conversation context and state"""
     
-    def __init__(self, session_id, user_id=None):
+    def __init__(self, session_id, user_id=None, store=None):
         self.session_id = session_id
         self.user_id = user_id
+        self.store = store
         self.conversation_id = None
-        self.history = []
+        self.history = deque(maxlen=MAX_HISTORY)
+        self.message_count = 0  # Including messages dropped from history
+        self.started_at = None  # Timestamp of the first known message
         self.entities = {}
         self.last_intent = None
         self.context_data = {}
+        self._pending = []  # Messages not yet written to the database
+        self._writing = None  # Batch the background writer is on, if any
+        self._write_errors = []  # Failures not yet raised by flush()
+        self._write_cond = threading.Condition()  # Guards the three above
         
         # Initialize or retrieve conversation
         self._init_conversation()
+        _LIVE_CONTEXTS.add(self)
     
     def _init_conversation(self):
         """Initialize or retrieve existing conversation"""
@@ -29,29 +89,49 @@ class ConversationContext:
             self.conversation_id = conv['id']
             # Load recent history
             messages = Database.get_conversation_messages(self.conversation_id, limit=10)
-            self.history = list(reversed(messages))  # Oldest first
+            for m in messages:
+                m['timestamp'] = _to_epoch(m['timestamp'])
+            self.history.extend(messages)
+            # Count and start time cover the whole session, not just the
+            # messages loaded into history
+            stats = Database.get_conversation_span(self.conversation_id)
+            self.message_count = stats['message_count']
+            if stats['started_at']:
+                self.started_at = _to_epoch(stats['started_at'])
+            # Restore state saved by an earlier process
+            state = self.store.load(self.session_id) if self.store else None
+            if state:
+                self.restore_state(state)
         else:
             self.conversation_id = Database.create_conversation(self.session_id, self.user_id)
     
-    def add_message(self, sender, message, intent=None, confidence=None):
-        """Add a message to the conversation"""
-        message_id = Database.add_message(
-            self.conversation_id, 
-            sender, 
-            message, 
-            intent, 
-            confidence
-        )
+    def add_message(self, sender, message, intent=None, confidence=None, wait=False):
+        """
+        Add a message to the conversation
         
-        # Update history
-        self.history.append({
-            'id': message_id,
+        Messages are buffered and written in the background when the bot
+        replies or FLUSH_THRESHOLD are pending. The returned ID is None
+        until that write has completed, when it is also set on the history
+        entry; pass wait=True to write now and get the ID, e.g. to link
+        feedback to the message.
+        """
+        entry = {
+            'id': None,
             'sender': sender,
             'message': message,
             'intent': intent,
             'confidence': confidence,
-            'timestamp': datetime.now()
-        })
+            'timestamp': time.time()
+        }
+        
+        # Update history
+        self.history.append(entry)
+        self.message_count += 1
+        if self.started_at is None:
+            self.started_at = entry['timestamp']
+        with self._write_cond:
+            self._pending.append(entry)
+            should_flush = len(self._pending) >= FLUSH_THRESHOLD
         
         # Update last intent if from user
         if sender == 'user' and intent:
@@ -61,38 +141,145 @@ class ConversationContext:
         if sender == 'user':
             self._extract_entities(message)
         
-        return message_id
+        if wait:
+            self.persist(wait=True)
+        elif should_flush or sender == 'bot':
+            self.persist()
+        
+        return entry['id']
+    
+    def flush(self, wait=False):
+        """
+        Write buffered messages to the database in one transaction
+        
+        The write runs on the background write executor, one batch at a
+        time per conversation so rows land in conversation order; pass
+        wait=True to block until everything buffered has been written.
+        A failed batch goes back to the front of the buffer for the next
+        flush, and the failure is raised by this or the next flush call.
+        """
+        with self._write_cond:
+            self._start_write()
+            if wait:
+                while self._writing is not None:
+                    self._write_cond.wait()
+            errors, self._write_errors = self._write_errors, []
+        if errors:
+            raise errors[0]
+    
+    def _start_write(self):
+        """Submit the buffer unless a batch is already being written (with _write_cond held)"""
+        if self._writing is not None or not self._pending:
+            return
+        batch, self._pending = self._pending, []
+        try:
+            future = submit_db_write(self._write_messages, batch)
+        except RuntimeError:
+            # The writer has shut down; close() writes the buffer instead
+            self._pending[:0] = batch
+            raise
+        self._writing = batch
+        future.add_done_callback(self._write_done)
+    
+    def _write_done(self, future):
+        """Requeue a failed batch, or chain the write of messages buffered meanwhile"""
+        error = future.exception()
+        with self._write_cond:
+            batch, self._writing = self._writing, None
+            if error is None:
+                try:
+                    self._start_write()
+                except RuntimeError as e:
+                    error = e
+            else:
+                # Nothing newer was submitted meanwhile, so the retry still
+                # writes these first
+                self._pending[:0] = batch
+            if error is not None:
+                self._write_errors.append(error)
+            self._write_cond.notify_all()
+        if error is not None:
+            logger.error("Writing messages for session %s failed: %s", self.session_id, error)
+    
+    def _write_messages(self, pending):
+        """Insert a batch of messages and record their IDs"""
+        message_ids = Database.add_messages_bulk(
+            (self.conversation_id, m['sender'], m['message'], m['intent'], m['confidence'])
+            for m in pending
+        )
+        for entry, message_id in zip(pending, message_ids):
+            entry['id'] = message_id
+    
+    def get_state(self):
+        """Get the state that is not recoverable from the messages table"""
+        return {
+            'entities': self.entities,
+            'last_intent': self.last_intent,
+            'context_data': self.context_data
+        }
+    
+    def restore_state(self, state):
+        """Take over state returned by get_state"""
+        self.entities = state['entities']
+        self.last_intent = state['last_intent']
+        self.context_data = state['context_data']
+    
+    def close(self):
+        """
+        Write all buffered messages before shutdown
+        
+        The last batch is written in the calling thread, since at exit the
+        background writer no longer takes new work.
+        """
+        with self._write_cond:
+            while self._writing is not None:
+                self._write_cond.wait()
+            pending, self._pending = self._pending, []
+            self._write_errors = []
+        if pending:
+            try:
+                self._write_messages(pending)
+            except Exception:
+                with self._write_cond:
+                    self._pending[:0] = pending
+                raise
+    
+    def has_unwritten(self):
+        """Check whether any messages are still buffered or being written"""
+        with self._write_cond:
+            return bool(self._pending or self._writing is not None)
+    
+    def persist(self, wait=False):
+        """Flush buffered messages and save the context state to the store"""
+        self.flush(wait)
+        if self.store:
+            self.store.save(self.session_id, self.get_state())
     
     def _extract_entities(self, message):
         """Extract entities from message (order numbers, product names, etc.)"""
-        # Extract order numbers (format: ORD-YYYY-NNN)
-        order_pattern = r'ORD-\d{4}-\d{3}'
-        orders = re.findall(order_pattern, message.upper())
-        if orders:
-            self.entities['order_number'] = orders[0]
-        
-        # Extract email addresses
-        email_pattern = r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b'
-        emails = re.findall(email_pattern, message)
-        if emails:
-            self.entities['email'] = emails[0]
+        found = {}
+        for key, pattern in _ENTITY_PATTERNS:
+            # The first match of each kind
+            match = pattern.search(message)
+            if match:
+                found[key] = match.group()
         
-        # Extract phone numbers (simple pattern)
-        phone_pattern = r'\b\d{3}[-.]?\d{3}[-.]?\d{4}\b'
-        phones = re.findall(phone_pattern, message)
-        if phones:
-            self.entities['phone'] = phones[0]
+        if 'order_number' in found:
+            found['order_number'] = found['order_number'].upper()
+        self.entities.update(found)
     
     def get_history(self, limit=5):
-        """Get recent conversation history"""
-        return self.history[-limit:] if self.history else []
+        """Get recent conversation history, oldest first"""
+        recent = list(islice(reversed(self.history), limit))
+        recent.reverse()
+        return recent
     
     def get_context_for_intent(self, current_intent):
         """Get relevant context for intent prediction"""
         context = {
             'last_intent': self.last_intent,
             'entities': self.entities,
-            'message_count': len(self.history),
+            'message_count': self.message_count,
             'has_order': 'order_number' in self.entities
         }
         
@@ -128,13 +315,16 @@ class ConversationContext:
     
     def end_conversation(self):
         """Mark conversation as ended"""
+        self.flush(wait=True)
         Database.end_conversation(self.session_id)
+        if self.store:
+            self.store.delete(self.session_id)
     
     def get_summary(self):
         """Get conversation summary"""
         return {
             'session_id': self.session_id,
-            'message_count': len(self.history),
+            'message_count': self.message_count,
             'last_intent': self.last_intent,
             'entities': self.entities,
             'duration': self._calculate_duration()
@@ -142,41 +332,138 @@ class ConversationContext:
     
     def _calculate_duration(self):
         """Calculate conversation duration"""
-        if len(self.history) < 2:
+        if self.message_count < 2:
             return 0
         
-        first = self.history[0]['timestamp']
-        last = self.history[-1]['timestamp']
-        
-        if isinstance(first, str):
-            first = datetime.fromisoformat(first)
-        if isinstance(last, str):
-            last = datetime.fromisoformat(last)
-        
-        duration = (last - first).total_seconds()
+        duration = self.history[-1]['timestamp'] - self.started_at
         return round(duration, 2)
 
+class RedisContextStore:
+    """Keeps context state in Redis so it is shared by workers and survives restarts"""
+    
+    def __init__(self, client, ttl=CONTEXT_TTL, prefix='ctx:'):
+        self.client = client  # a redis.Redis instance
+        self.ttl = ttl
+        self.prefix = prefix
+    
+    def load(self, session_id):
+        """Get saved state for a session, or None"""
+        data = self.client.get(self.prefix + session_id)
+        return orjson.loads(data) if data else None
+    
+    def save(self, session_id, state):
+        """Save state for a session and refresh its TTL"""
+        self.client.setex(self.prefix + session_id, self.ttl, orjson.dumps(state))
+    
+    def delete(self, session_id):
+        """Drop saved state for a session"""
+        self.client.delete(self.prefix + session_id)
+
+class MemoryContextStore:
+    """
+    Keeps context state in this process, for when no shared store is configured
+    
+    States are kept by reference, not copied; callers save states they no
+    longer modify.
+    """
+    
+    def __init__(self, ttl=CONTEXT_TTL, max_size=MAX_STORED_CONTEXTS):
+        self._states = LRUCache(max_size, ttl=ttl)
+    
+    def load(self, session_id):
+        """Get saved state for a session, or None"""
+        return self._states.get(session_id)
+    
+    def save(self, session_id, state):
+        """Save state for a session and refresh its TTL"""
+        self._states.set(session_id, state)
+    
+    def delete(self, session_id):
+        """Drop saved state for a session"""
+        self._states.delete(session_id)
+
 class ContextManager:
     """Manages multiple conversation contexts"""
     
-    def __init__(self):
-        self.contexts = {}
+    def __init__(self, store=None, max_contexts=MAX_CONTEXTS):
+        self.contexts = OrderedDict()  # Least recently used first
+        self.store = store
+        # Without a shared store, evicted contexts leave their state here
+        self._evicted_states = MemoryContextStore() if store is None else None
+        self.max_contexts = max_contexts
+        self._evicted = {}  # Evicted contexts whose messages are still being written
+        # Request threads share the contexts; creating one under the lock
+        # also keeps two threads from creating the same conversation
+        self._lock = threading.Lock()
     
     def get_context(self, session_id, user_id=None):
         """Get or create context for session"""
-        if session_id not in self.contexts:
-            self.contexts[session_id] = ConversationContext(session_id, user_id)
-        return self.contexts[session_id]
+        with self._lock:
+            self._prune_evicted()
+            context = self.contexts.get(session_id)
+            if context:
+                self.contexts.move_to_end(session_id)
+                return context
+            
+            # A context evicted while its writes are in flight is reused as is;
+            # reloading it from the database could miss those messages
+            context = self._evicted.pop(session_id, None)
+            if context is None:
+                context = ConversationContext(session_id, user_id, store=self.store)
+                if self._evicted_states:
+                    state = self._evicted_states.load(session_id)
+                    if state:
+                        context.restore_state(state)
+                        self._evicted_states.delete(session_id)
+            self.contexts[session_id] = context
+            
+            # Evict the least recently used context; it is reloaded on next use
+            if len(self.contexts) > self.max_contexts:
+                _, evicted = self.contexts.popitem(last=False)
+                evicted.persist()  # In the background; this lookup is not its caller
+                if self._evicted_states:
+                    self._evicted_states.save(evicted.session_id, evicted.get_state())
+                self._evicted[evicted.session_id] = evicted
+            
+            return context
+    
+    def _prune_evicted(self):
+        """Forget evicted contexts once all their messages are written (with _lock held)"""
+        for session_id, context in list(self._evicted.items()):
+            if not context.has_unwritten():
+                del self._evicted[session_id]
+                continue
+            try:
+                context.flush()  # Retries batches that failed to write
+            except Exception:
+                pass  # Already logged by the writer; the batch stays buffered
+    
+    def close(self):
+        """Write the buffered messages of every live and evicted context"""
+        with self._lock:
+            contexts = list(self.contexts.values()) + list(self._evicted.values())
+        errors = []
+        for context in contexts:
+            try:
+                context.close()
+            except Exception as e:
+                errors.append(e)
+        if errors:
+            raise errors[0]
     
     def remove_context(self, session_id):
         """Remove context (cleanup)"""
-        if session_id in self.contexts:
-            self.contexts[session_id].end_conversation()
-            del self.contexts[session_id]
+        with self._lock:
+            context = self.contexts.pop(session_id, None) or self._evicted.pop(session_id, None)
+            if self._evicted_states:
+                self._evicted_states.delete(session_id)
+        if context:
+            context.end_conversation()
     
     def get_active_sessions(self):
         """Get list of active session IDs"""
-        return list(self.contexts.keys())
+        with self._lock:
+            return list(self.contexts.keys())
 
 if __name__ == "__main__":
     # Test context manager
@@ -190,6 +477,6 @@ if __name__ == "__main__":
     ctx.add_message("user", "What's the status?", "help", 0.75)
     
     print(f"Entities extracted: {ctx.entities}")
-    print(f"Message count: {len(ctx.history)}")
+    print(f"Message count: {ctx.message_count}")
     print(f"Summary: {ctx.get_summary()}")
     print("\nContext Manager test complete!")
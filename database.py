@@ -4,25 +4,91 @@ Handles all database operations using SQLite
 """
 
 import sqlite3
+import atexit
 import json
+import queue
 from datetime import datetime
 from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from cache_utils import LRUCache
 
 DATABASE_PATH = 'chatbot.db'
 
+# Idle connections kept open for reuse; LIFO so the most recently used
+# (warmest page cache) connection is handed out first
+POOL_SIZE = 8
+_POOL = queue.LifoQueue(maxsize=POOL_SIZE)
+
+# Worker threads for database work that should not block the caller;
+# sqlite3 releases the GIL during I/O so reads overlap in practice
+DB_EXECUTOR = ThreadPoolExecutor(max_workers=4, thread_name_prefix='chatbot-db')
+
+# Background writes go through a single worker so they never contend for
+# the write lock and land in the order they were submitted
+DB_WRITE_EXECUTOR = ThreadPoolExecutor(max_workers=1, thread_name_prefix='chatbot-db-write')
+
+# Conversation rows by session ID, reused for CONV_CACHE_TTL seconds so a
+# change made by another process is picked up; least recently used first
+CONV_CACHE_SIZE = 4096
+CONV_CACHE_TTL = 60
+_CONV_CACHE = LRUCache(CONV_CACHE_SIZE, ttl=CONV_CACHE_TTL, copy=dict)
+
+def dict_factory(cursor, row):
+    """Build each result row directly as a dict keyed by column name"""
+    return {column[0]: value for column, value in zip(cursor.description, row)}
+
+def _connect():
+    """Open a connection configured for pooled use"""
+    # The pool guarantees one thread at a time per connection. Reads run in
+    # autocommit; writes open BEGIN IMMEDIATE so they take the write lock
+    # up front instead of failing to upgrade a read lock under contention.
+    conn = sqlite3.connect(DATABASE_PATH, check_same_thread=False, isolation_level='IMMEDIATE')
+    conn.row_factory = dict_factory  # Rows come back as plain dicts
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute('PRAGMA temp_store=MEMORY')
+    conn.execute('PRAGMA cache_size=-20000')
+    conn.execute('PRAGMA mmap_size=268435456')
+    return conn
+
+def _close_pool():
+    """Close the idle pooled connections"""
+    while True:
+        try:
+            _POOL.get_nowait().close()
+        except queue.Empty:
+            break
+
+atexit.register(_close_pool)
+
 @contextmanager
 def get_db_connection():
-    """Context manager for database connections"""
-    conn = sqlite3.connect(DATABASE_PATH)
-    conn.row_factory = sqlite3.Row  # Enable column access by name
+    """Context manager for database connections, borrowed from the pool"""
+    try:
+        conn = _POOL.get_nowait()
+    except queue.Empty:
+        conn = _connect()
     try:
         yield conn
-        conn.commit()
+        # Only writes leave a transaction open
+        if conn.in_transaction:
+            conn.commit()
     except Exception as e:
         conn.rollback()
         raise e
     finally:
-        conn.close()
+        try:
+            _POOL.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+def submit_db(func, *args, **kwargs):
+    """Run a database function on DB_EXECUTOR and return its Future"""
+    return DB_EXECUTOR.submit(func, *args, **kwargs)
+
+def submit_db_write(func, *args, **kwargs):
+    """Run a database write on DB_WRITE_EXECUTOR and return its Future"""
+    return DB_WRITE_EXECUTOR.submit(func, *args, **kwargs)
 
 class Database:
     """Database operations handler"""
@@ -107,10 +173,84 @@ class Database:
                 )
             ''')
             
+            # Daily conversation rollup, maintained by trigger for analytics
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS conversation_daily (
+                    date TEXT PRIMARY KEY,
+                    conversations INTEGER NOT NULL DEFAULT 0
+                )
+            ''')
+            cursor.execute('''
+                CREATE TRIGGER IF NOT EXISTS trg_conversation_daily
+                AFTER INSERT ON conversations
+                BEGIN
+                    INSERT INTO conversation_daily (date, conversations)
+                    VALUES (DATE(NEW.started_at), 1)
+                    ON CONFLICT(date) DO UPDATE SET conversations = conversations + 1;
+                END
+            ''')
+            # Backfill days recorded before the rollup existed
+            cursor.execute('''
+                INSERT OR IGNORE INTO conversation_daily (date, conversations)
+                SELECT DATE(started_at), COUNT(*) FROM conversations GROUP BY DATE(started_at)
+            ''')
+            
+            # Per-query frequency of user messages, maintained by trigger for analytics
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS query_frequency (
+                    message TEXT NOT NULL,
+                    intent TEXT NOT NULL,
+                    frequency INTEGER NOT NULL DEFAULT 0,
+                    confidence_total REAL NOT NULL DEFAULT 0,
+                    confidence_count INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (message, intent)
+                )
+            ''')
+            cursor.execute('''
+                CREATE TRIGGER IF NOT EXISTS trg_query_frequency
+                AFTER INSERT ON messages
+                WHEN NEW.sender = 'user' AND NEW.intent IS NOT NULL
+                BEGIN
+                    INSERT INTO query_frequency (message, intent, frequency, confidence_total, confidence_count)
+                    VALUES (NEW.message, NEW.intent, 1, COALESCE(NEW.confidence, 0), NEW.confidence IS NOT NULL)
+                    ON CONFLICT(message, intent) DO UPDATE SET
+                        frequency = frequency + 1,
+                        confidence_total = confidence_total + excluded.confidence_total,
+                        confidence_count = confidence_count + excluded.confidence_count;
+                END
+            ''')
+            # Backfill messages stored before the rollup existed
+            cursor.execute('''
+                INSERT OR IGNORE INTO query_frequency (message, intent, frequency, confidence_total, confidence_count)
+                SELECT message, intent, COUNT(*), TOTAL(confidence), COUNT(confidence)
+                FROM messages
+                WHERE sender = 'user' AND intent IS NOT NULL
+                GROUP BY message, intent
+            ''')
+            
             # Create indexes
             cursor.execute('CREATE INDEX IF NOT EXISTS idx_conversations_session ON conversations(session_id)')
-            cursor.execute('CREATE INDEX IF NOT EXISTS idx_messages_conversation ON messages(conversation_id)')
+            # (conversation_id, timestamp) also serves plain conversation_id lookups
+            cursor.execute('DROP INDEX IF EXISTS idx_messages_conversation')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_messages_conv_ts ON messages(conversation_id, timestamp)')
             cursor.execute('CREATE INDEX IF NOT EXISTS idx_orders_user ON orders(user_id)')
+            
+            # Analytics indexes (partial index matches the user-intent filter exactly)
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_messages_user_intent ON messages(intent, confidence)
+                WHERE sender = 'user' AND intent IS NOT NULL
+            ''')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_feedback_message ON feedback(message_id, rating)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_conversations_started_at ON conversations(started_at)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_query_frequency ON query_frequency(frequency DESC)')
+            
+            # Learning engine indexes: low-confidence user messages and
+            # negative feedback, both read newest first
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_msg_user_conf_ts ON messages(sender, confidence, timestamp DESC)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_feedback_rating_ts ON feedback(rating, timestamp DESC, message_id)')
+            
+            # Refresh planner statistics so the new indexes get picked
+            cursor.execute('ANALYZE')
     
     # User operations
     @staticmethod
@@ -131,19 +271,30 @@ class Database:
         with get_db_connection() as conn:
             cursor = conn.cursor()
             cursor.execute('SELECT * FROM users WHERE username = ?', (username,))
-            row = cursor.fetchone()
-            if row:
-                return dict(row)
-            return None
+            return cursor.fetchone()
     
     @staticmethod
     def get_or_create_user(username, email=None):
         """Get existing user or create new one"""
+        # Existing users are a plain read, which takes no write lock
         user = Database.get_user(username)
-        if not user:
-            user_id = Database.create_user(username, email)
-            user = Database.get_user(username)
-        return user
+        if user:
+            return user
+        
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                '''
+                INSERT INTO users (username, email) VALUES (?, ?)
+                ON CONFLICT(username) DO NOTHING
+                RETURNING *
+                ''',
+                (username, email)
+            )
+            user = cursor.fetchone()
+        
+        # Another writer created the user first; RETURNING yields no row then
+        return user or Database.get_user(username)
     
     # Conversation operations
     @staticmethod
@@ -160,13 +311,19 @@ class Database:
     @staticmethod
     def get_conversation(session_id):
         """Get conversation by session ID"""
+        conv = _CONV_CACHE.get(session_id)
+        if conv:
+            return conv
+        
         with get_db_connection() as conn:
             cursor = conn.cursor()
             cursor.execute('SELECT * FROM conversations WHERE session_id = ?', (session_id,))
-            row = cursor.fetchone()
-            if row:
-                return dict(row)
-            return None
+            conv = cursor.fetchone()
+        
+        # Unknown sessions are not cached; they are usually created next
+        if conv:
+            _CONV_CACHE.set(session_id, conv)
+        return conv
     
     @staticmethod
     def end_conversation(session_id):
@@ -177,6 +334,7 @@ class Database:
                 'UPDATE conversations SET ended_at = ? WHERE session_id = ?',
                 (datetime.now(), session_id)
             )
+        _CONV_CACHE.delete(session_id)
     
     # Message operations
     @staticmethod
@@ -190,16 +348,62 @@ class Database:
             )
             return cursor.lastrowid
     
+    @staticmethod
+    def add_messages_bulk(rows):
+        """
+        Add several messages in one transaction
+        
+        Args:
+            rows: iterable of (conversation_id, sender, message, intent, confidence)
+        
+        Returns:
+            list: new message IDs, in the order of `rows`
+        """
+        rows = list(rows)
+        if not rows:
+            return []
+        
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.executemany(
+                'INSERT INTO messages (conversation_id, sender, message, intent, confidence) VALUES (?, ?, ?, ?, ?)',
+                rows
+            )
+            # The write lock is held for the whole transaction, so IDs are consecutive
+            cursor.execute('SELECT last_insert_rowid() as last_id')
+            last_id = cursor.fetchone()['last_id']
+            return list(range(last_id - len(rows) + 1, last_id + 1))
+    
     @staticmethod
     def get_conversation_messages(conversation_id, limit=50):
-        """Get messages for a conversation"""
+        """Get the latest messages for a conversation, oldest first"""
         with get_db_connection() as conn:
             cursor = conn.cursor()
             cursor.execute(
-                'SELECT * FROM messages WHERE conversation_id = ? ORDER BY timestamp DESC LIMIT ?',
+                '''
+                SELECT * FROM (
+                    SELECT * FROM messages WHERE conversation_id = ?
+                    ORDER BY timestamp DESC, id DESC LIMIT ?
+                ) ORDER BY timestamp, id
+                ''',
                 (conversation_id, limit)
             )
-            return [dict(row) for row in cursor.fetchall()]
+            return cursor.fetchall()
+    
+    @staticmethod
+    def get_conversation_span(conversation_id):
+        """Get the message count and first message timestamp of one conversation"""
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            # Answered from idx_messages_conv_ts alone
+            cursor.execute(
+                '''
+                SELECT COUNT(*) as message_count, MIN(timestamp) as started_at
+                FROM messages WHERE conversation_id = ?
+                ''',
+                (conversation_id,)
+            )
+            return cursor.fetchone()
     
     # Feedback operations
     @staticmethod
@@ -220,10 +424,7 @@ class Database:
         with get_db_connection() as conn:
             cursor = conn.cursor()
             cursor.execute('SELECT * FROM products WHERE id = ?', (product_id,))
-            row = cursor.fetchone()
-            if row:
-                return dict(row)
-            return None
+            return cursor.fetchone()
     
     @staticmethod
     def search_products(query):
@@ -234,7 +435,7 @@ class Database:
                 'SELECT * FROM products WHERE name LIKE ? OR category LIKE ? LIMIT 10',
                 (f'%{query}%', f'%{query}%')
             )
-            return [dict(row) for row in cursor.fetchall()]
+            return cursor.fetchall()
     
     @staticmethod
     def get_all_products():
@@ -242,7 +443,34 @@ class Database:
         with get_db_connection() as conn:
             cursor = conn.cursor()
             cursor.execute('SELECT * FROM products')
-            return [dict(row) for row in cursor.fetchall()]
+            return cursor.fetchall()
+    
+    @staticmethod
+    def get_products_paginated(limit=10):
+        """Get the first `limit` products and the total product count"""
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                'SELECT *, (SELECT COUNT(*) FROM products) as _total FROM products LIMIT ?',
+                (limit,)
+            )
+            rows = cursor.fetchall()
+            if not rows:
+                return [], 0
+            
+            total = rows[0]['_total']
+            for row in rows:
+                del row['_total']
+            return rows, total
+    
+    @staticmethod
+    def get_price_range():
+        """Get the lowest and highest product price as (min, max)"""
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT MIN(price) as min_price, MAX(price) as max_price FROM products')
+            row = cursor.fetchone()
+            return row['min_price'], row['max_price']
     
     # Order operations
     @staticmethod
@@ -251,10 +479,7 @@ class Database:
         with get_db_connection() as conn:
             cursor = conn.cursor()
             cursor.execute('SELECT * FROM orders WHERE order_number = ?', (order_number,))
-            row = cursor.fetchone()
-            if row:
-                return dict(row)
-            return None
+            return cursor.fetchone()
     
     @staticmethod
     def get_user_orders(user_id):
@@ -262,7 +487,7 @@ class Database:
         with get_db_connection() as conn:
             cursor = conn.cursor()
             cursor.execute('SELECT * FROM orders WHERE user_id = ? ORDER BY created_at DESC', (user_id,))
-            return [dict(row) for row in cursor.fetchall()]
+            return cursor.fetchall()
     
     # Analytics
     @staticmethod
@@ -290,7 +515,7 @@ class Database:
                 GROUP BY intent 
                 ORDER BY count DESC
             ''')
-            intent_distribution = [dict(row) for row in cursor.fetchall()]
+            intent_distribution = cursor.fetchall()
             
             return {
                 'total_conversations': total_conversations,
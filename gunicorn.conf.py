@@ -0,0 +1,20 @@
+"""
+Gunicorn configuration for the chatbot web app
+Run with: gunicorn app:app
+"""
+
+import os
+
+# Binds gunicorn's default 127.0.0.1:8000 unless given --bind; worker
+# count comes from WEB_CONCURRENCY, as in gunicorn's own default
+workers = int(os.environ.get('WEB_CONCURRENCY', 1))
+
+# Import the app once in the master process; forked workers then share
+# its (memory-mapped) model pages copy-on-write
+preload_app = True
+
+
+def when_ready(server):
+    """Load the model in the master before any worker is forked"""
+    from app import get_chatbot
+    get_chatbot()
@@ -3,7 +3,7 @@ Database Initialization Script
 Creates tables and populates sample data
 """
 
-from database import Database
+from database import Database, get_db_connection
 import random
 
 def init_database():
@@ -17,23 +17,12 @@ def init_database():
     Database.create_tables()
     print("   [OK] Tables created")
     
-    # Create sample users
-    print("\n2. Creating sample users...")
     sample_users = [
         ('john_doe', 'john@example.com'),
         ('jane_smith', 'jane@example.com'),
         ('guest', None)
     ]
     
-    for username, email in sample_users:
-        try:
-            Database.create_user(username, email)
-        except:
-            pass  # User might already exist
-    print(f"   [OK] Created {len(sample_users)} users")
-    
-    # Create sample products
-    print("\n3. Creating sample products...")
     sample_products = [
         ('Laptop Pro 15"', 'Electronics', 1299.99, 15, 'High-performance laptop with 16GB RAM'),
         ('Wireless Mouse', 'Electronics', 29.99, 50, 'Ergonomic wireless mouse'),
@@ -47,20 +36,6 @@ def init_database():
         ('Monitor 24"', 'Electronics', 199.99, 12, 'Full HD IPS monitor'),
     ]
     
-    from database import get_db_connection
-    with get_db_connection() as conn:
-        cursor = conn.cursor()
-        # Check if products already exist
-        cursor.execute('SELECT COUNT(*) as count FROM products')
-        if cursor.fetchone()['count'] == 0:
-            cursor.executemany(
-                'INSERT INTO products (name, category, price, stock, description) VALUES (?, ?, ?, ?, ?)',
-                sample_products
-            )
-    print(f"   [OK] Created {len(sample_products)} products")
-    
-    # Create sample orders
-    print("\n4. Creating sample orders...")
     sample_orders = [
         (1, 'ORD-2024-001', 'Delivered', 1329.98),
         (1, 'ORD-2024-002', 'Shipped', 89.99),
@@ -68,16 +43,38 @@ def init_database():
         (2, 'ORD-2024-004', 'Delivered', 69.99),
     ]
     
+    # All sample data goes in one transaction (a single commit)
     with get_db_connection() as conn:
         cursor = conn.cursor()
-        # Check if orders already exist
-        cursor.execute('SELECT COUNT(*) as count FROM orders')
+        
+        # Create sample users
+        print("\n2. Creating sample users...")
+        # Usernames are unique, so existing users are skipped
+        cursor.executemany(
+            'INSERT OR IGNORE INTO users (username, email) VALUES (?, ?)',
+            sample_users
+        )
+        print(f"   [OK] Created {len(sample_users)} users")
+        
+        # Create sample products
+        print("\n3. Creating sample products...")
+        # Products have no unique key; check if they already exist
+        cursor.execute('SELECT COUNT(*) as count FROM products')
         if cursor.fetchone()['count'] == 0:
             cursor.executemany(
-                'INSERT INTO orders (user_id, order_number, status, total) VALUES (?, ?, ?, ?)',
-                sample_orders
+                'INSERT INTO products (name, category, price, stock, description) VALUES (?, ?, ?, ?, ?)',
+                sample_products
             )
-    print(f"   [OK] Created {len(sample_orders)} orders")
+        print(f"   [OK] Created {len(sample_products)} products")
+        
+        # Create sample orders
+        print("\n4. Creating sample orders...")
+        # Order numbers are unique, so existing orders are skipped
+        cursor.executemany(
+            'INSERT OR IGNORE INTO orders (user_id, order_number, status, total) VALUES (?, ?, ?, ?)',
+            sample_orders
+        )
+        print(f"   [OK] Created {len(sample_orders)} orders")
     
     print("\n" + "=" * 60)
     print("Database initialized successfully!")
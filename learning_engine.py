@@ -3,7 +3,9 @@ Learning Engine for Continuous Improvement
 Collects feedback and generates training data from conversations
 """
 
-from database import Database, get_db_connection
+from database import get_db_connection
+from itertools import groupby
+from operator import itemgetter
 import json
 from datetime import datetime, timedelta
 
@@ -16,7 +18,7 @@ class LearningEngine:
         with get_db_connection() as conn:
             cursor = conn.cursor()
             cursor.execute('''
-                SELECT m.*, f.rating 
+                SELECT m.id, m.message, m.intent, m.confidence, m.timestamp, f.rating 
                 FROM messages m
                 LEFT JOIN feedback f ON f.message_id = m.id
                 WHERE m.sender = 'user' 
@@ -25,7 +27,7 @@ class LearningEngine:
                 LIMIT 100
             ''', (confidence_threshold,))
             
-            return [dict(row) for row in cursor.fetchall()]
+            return cursor.fetchall()
     
     @staticmethod
     def get_negative_feedback_messages():
@@ -33,26 +35,29 @@ class LearningEngine:
         with get_db_connection() as conn:
             cursor = conn.cursor()
             cursor.execute('''
-                SELECT m.*, f.rating, f.comment
+                SELECT m.id, m.sender, m.message, m.intent, m.confidence, m.timestamp, f.rating, f.comment
                 FROM messages m
                 JOIN feedback f ON f.message_id = m.id
                 WHERE f.rating < 0
                 ORDER BY f.timestamp DESC
             ''')
             
-            return [dict(row) for row in cursor.fetchall()]
+            return cursor.fetchall()
     
     @staticmethod
     def generate_training_data():
-        """Generate new training data from conversations"""
-        training_data = []
+        """
+        Generate new training data from conversations
         
+        Returns:
+            list: dicts with 'pattern', 'intent' and 'confidence' of each learned example
+        """
         with get_db_connection() as conn:
             cursor = conn.cursor()
             
             # Get messages with high confidence and positive feedback
             cursor.execute('''
-                SELECT m.message, m.intent, m.confidence, f.rating
+                SELECT m.message as pattern, m.intent as intent, m.confidence as confidence
                 FROM messages m
                 LEFT JOIN feedback f ON f.message_id = m.id
                 WHERE m.sender = 'user' 
@@ -62,74 +67,115 @@ class LearningEngine:
                 GROUP BY m.message, m.intent
             ''')
             
-            for row in cursor.fetchall():
-                training_data.append({
-                    'pattern': row['message'],
-                    'intent': row['intent'],
-                    'confidence': row['confidence']
-                })
-        
-        return training_data
+            # Rows already have the output shape. Fetched in full so the
+            # pooled connection and its read snapshot are released on return
+            return cursor.fetchall()
     
     @staticmethod
     def export_training_data(filename='learned_intents.json'):
         """Export learned patterns to JSON file"""
-        training_data = LearningEngine.generate_training_data()
-        
-        # Group by intent
-        intents_dict = {}
-        for item in training_data:
-            intent = item['intent']
-            if intent not in intents_dict:
-                intents_dict[intent] = []
-            intents_dict[intent].append(item['pattern'])
-        
-        # Format for intents.json
-        export_data = []
-        for intent, patterns in intents_dict.items():
-            export_data.append({
-                'tag': intent,
-                'patterns': list(set(patterns)),  # Remove duplicates
-                'learned': True
-            })
-        
-        with open(filename, 'w', encoding='utf-8') as f:
-            json.dump({'learned_intents': export_data}, f, indent=2, ensure_ascii=False)
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            
+            # Same patterns as generate_training_data, in the order each was
+            # first seen; SQLite does not guarantee that order inside an
+            # aggregate, so rows are grouped and de-duplicated here
+            cursor.execute('''
+                SELECT m.intent as tag, m.message as message
+                FROM messages m
+                LEFT JOIN feedback f ON f.message_id = m.id
+                WHERE m.sender = 'user'
+                AND m.intent IS NOT NULL
+                AND m.confidence > 0.7
+                AND (f.rating IS NULL OR f.rating > 0)
+                ORDER BY m.intent, m.id
+            ''')
+            
+            # Stream one intents.json entry per line, an intent at a time
+            count = 0
+            with open(filename, 'w', encoding='utf-8') as f:
+                f.write('{"learned_intents": [')
+                for tag, rows in groupby(cursor, key=itemgetter('tag')):
+                    if count:
+                        f.write(',')
+                    patterns = list(dict.fromkeys(row['message'] for row in rows))
+                    tag = json.dumps(tag, ensure_ascii=False)
+                    patterns = json.dumps(patterns, ensure_ascii=False)
+                    f.write(f'\n  {{"tag": {tag}, "patterns": {patterns}, "learned": true}}')
+                    count += 1
+                f.write('\n]}\n')
         
-        return len(export_data)
+        return count
+    
+    @staticmethod
+    def _suggestion_counts(confidence_threshold=0.5):
+        """Get the counts behind the improvement suggestions in one query"""
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                WITH low AS (
+                    SELECT COUNT(*) as count
+                    FROM messages
+                    WHERE sender = 'user' AND confidence < ?
+                ),
+                negative AS (
+                    SELECT COUNT(*) as count
+                    FROM messages m
+                    JOIN feedback f ON f.message_id = m.id
+                    WHERE f.rating < 0
+                ),
+                top AS (
+                    SELECT intent, COUNT(*) as count
+                    FROM messages
+                    WHERE intent IS NOT NULL
+                    GROUP BY intent
+                    ORDER BY count DESC
+                    LIMIT 1
+                )
+                SELECT 
+                    low.count as low_confidence,
+                    negative.count as negative_feedback,
+                    (SELECT COUNT(*) FROM messages) as total_messages,
+                    top.intent as top_intent,
+                    top.count as top_intent_count
+                FROM low, negative
+                LEFT JOIN top ON 1
+            ''', (confidence_threshold,))
+            
+            return cursor.fetchone()
     
     @staticmethod
     def get_improvement_suggestions():
         """Get suggestions for model improvement"""
         suggestions = []
+        counts = LearningEngine._suggestion_counts()
         
         # Check for low confidence messages
-        low_conf = LearningEngine.collect_misclassified_intents()
-        if len(low_conf) > 10:
+        low_conf = counts['low_confidence']
+        if low_conf > 10:
             suggestions.append({
                 'type': 'low_confidence',
-                'count': len(low_conf),
-                'suggestion': f'Found {len(low_conf)} messages with low confidence. Consider adding more training patterns.'
+                'count': low_conf,
+                'suggestion': f'Found {low_conf} messages with low confidence. Consider adding more training patterns.'
             })
         
         # Check for negative feedback
-        negative = LearningEngine.get_negative_feedback_messages()
-        if len(negative) > 5:
+        negative = counts['negative_feedback']
+        if negative > 5:
             suggestions.append({
                 'type': 'negative_feedback',
-                'count': len(negative),
-                'suggestion': f'Found {len(negative)} messages with negative feedback. Review and improve responses.'
+                'count': negative,
+                'suggestion': f'Found {negative} messages with negative feedback. Review and improve responses.'
             })
         
         # Check intent distribution
-        stats = Database.get_conversation_stats()
-        if stats['intent_distribution']:
-            top_intent = stats['intent_distribution'][0]
-            if top_intent['count'] > stats['total_messages'] * 0.5:
+        top_intent = counts['top_intent']
+        if top_intent is not None:
+            if counts['top_intent_count'] > counts['total_messages'] * 0.5:
                 suggestions.append({
                     'type': 'intent_imbalance',
-                    'intent': top_intent['intent'],
-                    'suggestion': f'Intent "{top_intent["intent"]}" dominates ({top_intent["count"]} messages). Consider diversifying training data.'
+                    'intent': top_intent,
+                    'suggestion': f'Intent "{top_intent}" dominates ({counts["top_intent_count"]} messages). Consider diversifying training data.'
                 })
         
         return suggestions
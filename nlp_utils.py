@@ -4,38 +4,42 @@ Contains text preprocessing and NLP helper functions
 """
 
 import nltk
-from nltk.tokenize import word_tokenize
 from nltk.stem import WordNetLemmatizer
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from itertools import chain
 import string
 import re
 
+_URL_RE = re.compile(r'http\S+|www\S+|https\S+')
+_PUNCT_TABLE = str.maketrans('', '', string.punctuation)
+
+# NLTK resources used here: (data path, download package)
+NLTK_RESOURCES = (
+    ('corpora/stopwords', 'stopwords'),
+    ('corpora/wordnet', 'wordnet'),
+    ('corpora/omw-1.4', 'omw-1.4'),
+)
+
+def _is_installed(resource):
+    """Check whether an NLTK resource is already on disk"""
+    try:
+        nltk.data.find(resource)
+        return True
+    except LookupError:
+        return False
+
 # Download required NLTK data
 def download_nltk_data():
     """Download necessary NLTK datasets"""
-    try:
-        nltk.data.find('tokenizers/punkt')
-    except LookupError:
-        nltk.download('punkt', quiet=True)
-    
-    try:
-        nltk.data.find('tokenizers/punkt_tab')
-    except LookupError:
-        nltk.download('punkt_tab', quiet=True)
-    
-    try:
-        nltk.data.find('corpora/stopwords')
-    except LookupError:
-        nltk.download('stopwords', quiet=True)
-    
-    try:
-        nltk.data.find('corpora/wordnet')
-    except LookupError:
-        nltk.download('wordnet', quiet=True)
-    
-    try:
-        nltk.data.find('corpora/omw-1.4')
-    except LookupError:
-        nltk.download('omw-1.4', quiet=True)
+    # Probe all resources concurrently; each probe walks every nltk_data path
+    with ThreadPoolExecutor(max_workers=len(NLTK_RESOURCES)) as executor:
+        installed = list(executor.map(_is_installed, [path for path, _ in NLTK_RESOURCES]))
+    
+    # nltk.download is not thread-safe, so fetch missing ones one at a time
+    for (_, package), found in zip(NLTK_RESOURCES, installed):
+        if not found:
+            nltk.download(package, quiet=True)
 
 # Download NLTK data on import
 download_nltk_data()
@@ -43,7 +47,10 @@ download_nltk_data()
 # Initialize lemmatizer and stopwords after download
 from nltk.corpus import stopwords
 lemmatizer = WordNetLemmatizer()
-stop_words = set(stopwords.words('english'))
+stop_words = frozenset(stopwords.words('english'))
+
+# WordNet lookups dominate cleaning time and the vocabulary is small
+_lemmatize = lru_cache(maxsize=50000)(lemmatizer.lemmatize)
 
 
 def preprocess_text(text):
@@ -60,16 +67,30 @@ def preprocess_text(text):
     text = text.lower()
     
     # Remove URLs
-    text = re.sub(r'http\S+|www\S+|https\S+', '', text, flags=re.MULTILINE)
+    text = _URL_RE.sub('', text)
     
     # Remove punctuation
-    text = text.translate(str.maketrans('', '', string.punctuation))
+    text = text.translate(_PUNCT_TABLE)
     
     # Remove extra whitespace
     text = ' '.join(text.split())
     
     return text
 
+def _preprocess_lines(corpus):
+    """
+    Preprocess newline-separated texts in one pass
+    
+    Args:
+        corpus (str): Texts joined with newlines
+    
+    Returns:
+        list: Preprocessed text of each line, whitespace not yet collapsed
+    """
+    # URLs never span lines (\S stops at the newline)
+    corpus = _URL_RE.sub('', corpus.lower())
+    return corpus.translate(_PUNCT_TABLE).split('\n')
+
 def tokenize_and_lemmatize(text):
     """
     Tokenize and lemmatize text
@@ -80,12 +101,13 @@ def tokenize_and_lemmatize(text):
     Returns:
         list: List of lemmatized tokens
     """
-    # Tokenize
-    tokens = word_tokenize(text)
+    # Tokenize; preprocess_text has already stripped punctuation, so
+    # tokens are just the whitespace-separated words
+    tokens = text.split()
     
     # Lemmatize and remove stopwords
     lemmatized_tokens = [
-        lemmatizer.lemmatize(token) 
+        _lemmatize(token) 
         for token in tokens 
         if token not in stop_words and len(token) > 1
     ]
@@ -111,6 +133,41 @@ def clean_text(text):
     # Join tokens back into string
     return ' '.join(tokens)
 
+def clean_texts(texts):
+    """
+    Clean several texts at once (same output as clean_text on each)
+    
+    The batch is preprocessed as one newline-joined string and each
+    distinct token is looked up once for the whole batch.
+    
+    Args:
+        texts (list): Input texts
+    
+    Returns:
+        list: Cleaned texts, in input order
+    """
+    corpus = '\n'.join(texts)
+    if corpus.count('\n') == len(texts) - 1:
+        # One lower/URL/punctuation pass over the corpus; none of them
+        # touch the newlines, so lines still map back to the input texts
+        lines = _preprocess_lines(corpus)
+    else:
+        # A text contains a newline itself; clean them one at a time
+        lines = [preprocess_text(text) for text in texts]
+    token_lists = [line.split() for line in lines]
+    
+    # Lemmas of the tokens that survive stopword removal
+    lemmas = {
+        token: _lemmatize(token)
+        for token in set(chain.from_iterable(token_lists))
+        if token not in stop_words and len(token) > 1
+    }
+    
+    return [
+        ' '.join([lemmas[token] for token in tokens if token in lemmas])
+        for tokens in token_lists
+    ]
+
 if __name__ == "__main__":
     # Download NLTK data when module is run directly
     print("Downloading NLTK data...")
@@ -4,6 +4,7 @@ This script runs automated tests with various customer queries
 """
 
 from chatbot import CustomerServiceChatbot
+import io
 import sys
 
 def test_chatbot():
@@ -40,9 +41,13 @@ def test_chatbot():
     correct = 0
     total = len(test_queries)
     
-    for query, expected_intent in test_queries:
-        # Get prediction
-        predicted_intent, confidence = bot.predict_intent(query)
+    # Predict all queries in one pass; chat() then reuses the cached predictions
+    predictions = bot.predict_intent_batch([query for query, _ in test_queries])
+    
+    # Results are collected and written to stdout in one go
+    results = io.StringIO()
+    
+    for (query, expected_intent), (predicted_intent, confidence) in zip(test_queries, predictions):
         response = bot.chat(query)
         
         # Check if correct
@@ -52,10 +57,12 @@ def test_chatbot():
         
         # Print result
         status = "[OK]" if is_correct else "[FAIL]"
-        print(f"{status} Query: \"{query}\"")
-        print(f"     Expected: {expected_intent} | Predicted: {predicted_intent} | Confidence: {confidence:.2f}")
-        print(f"     Response: {response}")
-        print()
+        print(f"{status} Query: \"{query}\"", file=results)
+        print(f"     Expected: {expected_intent} | Predicted: {predicted_intent} | Confidence: {confidence:.2f}", file=results)
+        print(f"     Response: {response}", file=results)
+        print(file=results)
+    
+    sys.stdout.write(results.getvalue())
     
     # Print summary
     accuracy = (correct / total) * 100